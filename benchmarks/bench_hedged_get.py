@@ -0,0 +1,89 @@
+# PyNetlify - Python client and library to interact with Netlify API.
+# Copyright (C) 2019  Toni Sissala
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Measure GET latency percentiles with and without hedging against
+a local stand-in for Netlify API that injects latency spikes.
+
+Usage::
+
+   python benchmarks/bench_hedged_get.py [number-of-requests] [seed]
+"""
+import os
+import sys
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pynetlify import pynetlify  # noqa: E402
+
+
+BASE_LATENCY = 0.005
+SPIKE_LATENCY = 0.5
+SPIKE_PROBABILITY = 0.03
+
+
+class SpikyHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if random.random() < SPIKE_PROBABILITY:
+            time.sleep(SPIKE_LATENCY)
+        else:
+            time.sleep(BASE_LATENCY)
+        body = json.dumps({'id': 'dep_id', 'state': 'ready'}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def percentile(latencies, pct):
+    latencies = sorted(latencies)
+    return latencies[int(pct / 100.0 * len(latencies)) - 1]
+
+
+def measure(name, api, nof_requests):
+    latencies = []
+    for _ in range(nof_requests):
+        start = time.perf_counter()
+        api.get_deploy('dep_id')
+        latencies.append(time.perf_counter() - start)
+    print('{:<10} p50 {:>7.1f} ms  p99 {:>7.1f} ms  max {:>7.1f} ms'.format(
+        name, percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000,
+        max(latencies) * 1000))
+
+
+def main(nof_requests, seed):
+    random.seed(seed)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SpikyHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = 'http://127.0.0.1:{}/api/'.format(server.server_address[1])
+    for name, hedge_gets in (('plain', False), ('hedged', True)):
+        api = pynetlify.APIRequest('auth-token', hedge_gets=hedge_gets)
+        api.base_url = base_url
+        measure(name, api, nof_requests)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 0)
@@ -0,0 +1,66 @@
+# PyNetlify - Python client and library to interact with Netlify API.
+# Copyright (C) 2019  Toni Sissala
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Measure deploy manifest payload size, encode time and peak memory.
+
+Usage::
+
+   python benchmarks/bench_manifest.py [number-of-files]
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pynetlify import pynetlify  # noqa: E402
+
+
+def synthetic_files_hashes(nof_files):
+    return {'section-{}/page-{}/index.html'.format(i // 1000, i):
+            hashlib.sha1(str(i).encode('ascii')).hexdigest()
+            for i in range(nof_files)}
+
+
+def measure(name, encode):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = encode()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('{:<24} {:>12} bytes {:>8.3f} s {:>10.1f} KiB peak'.format(
+        name, size, elapsed, peak / 1024.0))
+
+
+def consume(chunks):
+    return sum(len(chunk) for chunk in chunks)
+
+
+def main(nof_files):
+    files_hashes = synthetic_files_hashes(nof_files)
+    print('Manifest of {} files'.format(nof_files))
+    measure('json.dumps (before)',
+            lambda: len(json.dumps({'files': files_hashes}).encode('utf-8')))
+    measure('streamed',
+            lambda: consume(pynetlify.iter_manifest_json(files_hashes)))
+    measure('streamed gzip',
+            lambda: consume(pynetlify.iter_gzip(pynetlify.iter_manifest_json(files_hashes))))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300000)
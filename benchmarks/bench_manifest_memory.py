@@ -0,0 +1,83 @@
+# PyNetlify - Python client and library to interact with Netlify API.
+# Copyright (C) 2019  Toni Sissala
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Measure memory held by the in-memory deploy manifest.
+
+Compares the two dictionaries previously used by
+``deploy_folder_to_site`` to :obj:`pynetlify.Manifest`.
+
+Usage::
+
+   python benchmarks/bench_manifest_memory.py [number-of-files ...]
+"""
+import os
+import sys
+import time
+import hashlib
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pynetlify import pynetlify  # noqa: E402
+
+
+FOLDER = os.path.join(os.sep, 'srv', 'site', 'public') + os.sep
+
+
+def synthetic_filepaths(nof_files):
+    for i in range(nof_files):
+        yield FOLDER + os.path.join('section-{}'.format(i // 1000),
+                                    'page-{}'.format(i // 10),
+                                    ('index.html', 'style.css', 'app.js', 'logo.png',
+                                     'photo-{}.jpg'.format(i))[i % 5])
+
+
+def build_dicts(nof_files):
+    files_hashes = {}
+    for i, filepath in enumerate(synthetic_filepaths(nof_files)):
+        files_hashes[filepath.replace(FOLDER, '', 1)] = \
+            hashlib.sha1(str(i).encode('ascii')).hexdigest()
+    hashes_files = {value: key for (key, value) in files_hashes.items()}
+    return files_hashes, hashes_files
+
+
+def build_manifest(nof_files):
+    manifest = pynetlify.Manifest()
+    for i, filepath in enumerate(synthetic_filepaths(nof_files)):
+        manifest.add(filepath[len(FOLDER):],
+                     hashlib.sha1(str(i).encode('ascii')).digest())
+    manifest.path_of(hashlib.sha1(b'0').hexdigest())
+    return manifest
+
+
+def measure(name, build, nof_files):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build(nof_files)
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    print('{:<10} {:>9} files {:>10.1f} MiB {:>8.2f} s'.format(
+        name, nof_files, current / 1024.0 / 1024.0, elapsed))
+
+
+def main(sizes):
+    for nof_files in sizes:
+        measure('dicts', build_dicts, nof_files)
+        measure('Manifest', build_manifest, nof_files)
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10 ** 5, 10 ** 6])
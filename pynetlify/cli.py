@@ -40,27 +40,47 @@ POLL_DEPLOYS_COUNT = 5
 
 
 def deploy_folder(netlify_api, args):
-    site = netlify_api.get_site(args.site_id)
+    if not args.trace:
+        _deploy_folder(netlify_api, args, pynetlify.NullTimeline())
+        return
+    # Open trace file before deploying to fail early on an unwritable path.
+    with open(args.trace, 'w') as trace_file:
+        timeline = pynetlify.Timeline()
+        try:
+            _deploy_folder(netlify_api, args, timeline)
+        finally:
+            try:
+                timeline.dump(trace_file)
+            except (IOError, OSError, TypeError, ValueError):
+                logging.exception('Could not write trace to %s', args.trace)
+
+
+def _deploy_folder(netlify_api, args, timeline):
+    with timeline.span('get_site', 'phase'):
+        site = netlify_api.get_site(args.site_id)
     deploy_id = netlify_api.deploy_folder_to_site(
         args.folder,
-        site)
+        site,
+        timeline=timeline)
     if deploy_id is None:
         print('Nothing to deploy')
         return
     nof_poll_deploys = POLL_DEPLOYS_COUNT
     site_live = False
     print('Polling to see when deploy is live')
-    while nof_poll_deploys:
-        if sys.version_info[0] == 2:
-            print('.', end='')
-        else:
-            print('.', end='', flush=True)
-        deploy = netlify_api.get_deploy(deploy_id)
-        if deploy['state'] == 'ready':
-            site_live = True
-            break
-        nof_poll_deploys -= 1
-        time.sleep(2)
+    with timeline.span('wait_ready', 'phase'):
+        while nof_poll_deploys:
+            if sys.version_info[0] == 2:
+                print('.', end='')
+            else:
+                print('.', end='', flush=True)
+            with timeline.span('poll', 'request'):
+                deploy = netlify_api.get_deploy(deploy_id)
+            if deploy['state'] == 'ready':
+                site_live = True
+                break
+            nof_poll_deploys -= 1
+            time.sleep(2)
     msg = 'Site deployed and live at {}'.format(site.url) if site_live else 'Site deployed but not live'
     print(msg)
 
@@ -97,6 +117,18 @@ def delete_site(netlify_api, args):
         id=args.site_id))
 
 
+def list_deploys(netlify_api, args):
+    site = pynetlify.Site(name=None, url=None, id=args.site_id)
+    for deploy in netlify_api.list_deploys(site):
+        print(deploy)
+
+
+def rollback(netlify_api, args):
+    site = pynetlify.Site(name=None, url=None, id=args.site_id)
+    deploy = netlify_api.restore_deploy(site, args.deploy_id)
+    print(deploy)
+
+
 def delete_all_sites(netlify_api, args):
     for site in netlify_api.sites():
         netlify_api.delete_site(site)
@@ -123,6 +155,13 @@ def cli_argparser():
                            help='Configuration file path.')
     argparser.add_argument('--loglevel', default='INFO', choices=[
         'DEBUG', 'INFO', 'WARN', 'ERROR'])
+    argparser.add_argument('--connect-timeout', type=float, default=None,
+                           help='Seconds to wait for a connection to Netlify API.')
+    argparser.add_argument('--read-timeout', type=float, default=None,
+                           help='Seconds to wait between bytes of a response.')
+    argparser.add_argument('--hedge-after', type=float, default=None,
+                           help='Send a duplicate of GET requests not answered within '
+                                'this many seconds. Later measured latencies shorten the delay.')
     # Create site parser
     create_site_parser = subparsers.add_parser('create_site')
     create_site_parser.add_argument('--name', type=str,
@@ -139,9 +178,20 @@ def cli_argparser():
     deploy_folder_parser = subparsers.add_parser('deploy_folder')
     deploy_folder_parser.add_argument('--site-id', required=True,
                                       type=str)
+    deploy_folder_parser.add_argument('--compress-manifest', action='store_true', default=None,
+                                      help='Send file manifest gzip compressed')
+    deploy_folder_parser.add_argument('--trace', type=str, default=None,
+                                      help='Write deploy timeline as Chrome trace event JSON to file.')
     deploy_folder_parser.add_argument('folder', type=str)
     # List sites parser
     subparsers.add_parser('list_sites')
+    # List deploys parser
+    list_deploys_parser = subparsers.add_parser('list_deploys')
+    list_deploys_parser.add_argument('site_id', type=str)
+    # Rollback parser
+    rollback_parser = subparsers.add_parser('rollback')
+    rollback_parser.add_argument('site_id', type=str)
+    rollback_parser.add_argument('deploy_id', type=str)
     # Delete site parser
     delete_site_parser = subparsers.add_parser('delete_site')
     delete_site_parser.add_argument('site_id', type=str)
@@ -191,7 +241,9 @@ def cli_main():
                          'delete_site': delete_site,
                          'delete_all_sites': delete_all_sites,
                          'deploy_folder': deploy_folder,
-                         'list_sites': list_sites}
+                         'list_sites': list_sites,
+                         'list_deploys': list_deploys,
+                         'rollback': rollback}
     argparser = cli_argparser()
     args = argparser.parse_args()
     logging.basicConfig(level=getattr(logging, args.loglevel))
@@ -205,6 +257,11 @@ def cli_main():
         argparser.print_help()
         return 1
     selected_action = available_actions.get(args.action)
-    netlify_api = pynetlify.APIRequest(auth_token)
+    netlify_api = pynetlify.APIRequest(auth_token,
+                                       compress_manifest=getattr(args, 'compress_manifest', None),
+                                       connect_timeout=args.connect_timeout,
+                                       read_timeout=args.read_timeout,
+                                       hedge_gets=args.hedge_after is not None,
+                                       hedge_after=args.hedge_after)
     selected_action(netlify_api, args)
     return 0
@@ -16,9 +16,18 @@
 
 import os
 import sys
-from collections import namedtuple
+import math
+import time
+import struct
+import threading
+import binascii
+from array import array
+from collections import namedtuple, deque
+from contextlib import contextmanager
 import hashlib
 import glob
+import json
+import zlib
 import logging
 import pprint
 import requests
@@ -26,11 +35,27 @@ import requests
 
 if sys.version_info[0] == 2:
     from urllib import quote as quote_url
+    import Queue as queue
+
+    def _encode_path(path):
+        return path
+
+    def _decode_path(raw):
+        return bytes(raw)
 else:
     from urllib.parse import quote as quote_url
+    import queue
+
+    def _encode_path(path):
+        return path.encode('utf-8', 'surrogateescape')
+
+    def _decode_path(raw):
+        return raw.decode('utf-8', 'surrogateescape')
 
 
 Site = namedtuple('Site', ['name', 'id', 'url'])
+Deploy = namedtuple('Deploy', ['id', 'site_id', 'state', 'created_at', 'title'])
+TimelineEvent = namedtuple('TimelineEvent', ['name', 'category', 'start', 'end', 'worker', 'args'])
 logger = logging.getLogger(__name__)
 
 
@@ -47,6 +72,21 @@ def rdict_to_site(rdict):
     return Site(name=rdict['name'], id=rdict['id'], url=rdict['url'])
 
 
+def rdict_to_deploy(rdict):
+    """Create a new :obj:`Deploy` from a dictionary received from
+    a HTTP response JSON payload.
+
+    :param rdict: HTTP response dictionary.
+    :type rdict: dict
+    :returns: Deploy created from the dictionary.
+    :rtype: :obj:`Deploy`
+    """
+    logger.debug(pprint.pformat(rdict))
+    return Deploy(id=rdict['id'], site_id=rdict.get('site_id'),
+                  state=rdict.get('state'), created_at=rdict.get('created_at'),
+                  title=rdict.get('title'))
+
+
 def _iter_folder_filepaths_py3(folder):
     lookup_path = os.path.join(folder, '**')
     for filepath in glob.iglob(lookup_path, recursive=True):
@@ -63,19 +103,439 @@ def _iter_folder_filepaths_py2(folder):
 iterate_folder_filepaths = _iter_folder_filepaths_py2 if sys.version_info[0] == 2 else _iter_folder_filepaths_py3
 
 
+def iter_manifest_json(files_hashes, chunk_size=65536):
+    """Encode deploy manifest ``{"files": {path: hash}}`` as JSON
+    incrementally. Only one chunk of the encoded manifest is held
+    in memory at a time.
+
+    :param files_hashes: Pairs of file paths and hex digests.
+    :type files_hashes: dict or :obj:`Manifest`
+    :param chunk_size: Approximate size of yielded chunks in bytes.
+    :type chunk_size: int
+    :returns: Encoded manifest in chunks.
+    :rtype: bytes
+    """
+    encode_string = json.encoder.encode_basestring_ascii
+    chunk = ['{"files": {']
+    chunk_length = 0
+    separator = ''
+    for filepath, filehash in files_hashes.items():
+        entry = '{}{}: "{}"'.format(separator, encode_string(filepath), filehash)
+        chunk.append(entry)
+        chunk_length += len(entry)
+        separator = ', '
+        if chunk_length >= chunk_size:
+            yield ''.join(chunk).encode('ascii')
+            chunk = []
+            chunk_length = 0
+    chunk.append('}}')
+    yield ''.join(chunk).encode('ascii')
+
+
+def iter_gzip(chunks, compresslevel=6):
+    """Compress chunks of bytes to a gzip stream.
+
+    :param chunks: Chunks to compress.
+    :type chunks: iterable
+    :param compresslevel: Compression level from 1 to 9.
+    :type compresslevel: int
+    :returns: Compressed chunks.
+    :rtype: bytes
+    """
+    # wbits 16 + MAX_WBITS writes gzip header and trailer.
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+class Timeline(object):
+    """Record timed spans of work. Spans get exported as Chrome
+    trace event JSON, viewable in chrome://tracing or Perfetto.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.origin = time.time()
+
+    @contextmanager
+    def span(self, name, category, **args):
+        """Record a span of work.
+
+        :param name: Name of the span.
+        :type name: str
+        :param category: Category of the span, such as phase or file.
+        :type category: str
+        :param args: Additional information of the span.
+        :returns: Context manager yielding args. Items added to
+                  args get recorded with the span.
+        """
+        start = time.time()
+        try:
+            yield args
+        finally:
+            self.events.append(TimelineEvent(
+                name=name, category=category, start=start, end=time.time(),
+                worker=threading.current_thread().name, args=args))
+
+    def timed_iter(self, iterable, args, key):
+        """Iterate an iterable and add the time spent in producing
+        its items to ``args[key]``.
+
+        :param iterable: Iterable to time.
+        :param args: Span args to record the time to.
+        :type args: dict
+        :param key: Key of the time in seconds in args.
+        :type key: str
+        :returns: Items of the iterable.
+        """
+        args[key] = 0.0
+        iterator = iter(iterable)
+        while True:
+            start = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                args[key] += time.time() - start
+                return
+            args[key] += time.time() - start
+            yield item
+
+    def to_chrome_trace(self):
+        """Convert recorded spans to Chrome trace event format.
+
+        :returns: Trace with complete events in microseconds.
+        :rtype: dict
+        """
+        pid = os.getpid()
+        worker_ids = {}
+        trace_events = []
+        for event in self.events:
+            if event.worker not in worker_ids:
+                worker_ids[event.worker] = len(worker_ids) + 1
+                trace_events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid,
+                                     'tid': worker_ids[event.worker],
+                                     'args': {'name': event.worker}})
+            trace_events.append({'name': event.name, 'cat': event.category, 'ph': 'X',
+                                 'ts': (event.start - self.origin) * 1e6,
+                                 'dur': (event.end - event.start) * 1e6,
+                                 'pid': pid, 'tid': worker_ids[event.worker],
+                                 'args': event.args})
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+    def dump(self, filehandle):
+        """Write recorded spans as Chrome trace event JSON.
+
+        :param filehandle: Open text file.
+        """
+        json.dump(self.to_chrome_trace(), filehandle)
+
+
+class _NullSpan(object):
+
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class NullTimeline(object):
+    """Timeline which records nothing. Used when tracing is off."""
+
+    events = ()
+    _null_span = _NullSpan()
+
+    def span(self, name, category, **args):
+        return self._null_span
+
+    def timed_iter(self, iterable, args, key):
+        return iterable
+
+
+class Manifest(object):
+    """Compact mapping of deployed file paths to SHA1 digests.
+
+    Digests are stored as 20 byte binary values in a single
+    contiguous buffer. Paths are split to a shared directory prefix
+    and a file name. File names are stored encoded in another
+    contiguous buffer. Digests get converted to hex only when
+    iterating items. Digest lookups use an open addressing table of
+    entry indexes instead of a second dictionary.
+    """
+
+    digest_size = 20
+
+    def __init__(self):
+        self._prefixes = []
+        self._prefix_indexes = {}
+        self._entry_prefixes = array('I')
+        self._name_offsets = array('I', [0])
+        self._names = bytearray()
+        self._digests = bytearray()
+        self._table = None
+
+    def __len__(self):
+        return len(self._entry_prefixes)
+
+    def add(self, path, digest):
+        """Add a file to manifest.
+
+        :param path: Path relative to deployed folder.
+        :type path: str
+        :param digest: Binary SHA1 digest of file contents.
+        :type digest: bytes
+        """
+        if len(digest) != self.digest_size:
+            raise ValueError('Invalid digest size %s' % (len(digest),))
+        head, sep, name = path.rpartition(os.sep)
+        prefix = head + sep
+        prefix_index = self._prefix_indexes.get(prefix)
+        if prefix_index is None:
+            prefix_index = len(self._prefixes)
+            self._prefixes.append(prefix)
+            self._prefix_indexes[prefix] = prefix_index
+        self._entry_prefixes.append(prefix_index)
+        self._names.extend(_encode_path(name))
+        self._name_offsets.append(len(self._names))
+        self._digests.extend(digest)
+        self._table = None
+
+    def path(self, index):
+        """Get path of an entry.
+
+        :param index: Index of the entry.
+        :type index: int
+        :returns: Path relative to deployed folder.
+        :rtype: str
+        """
+        name = _decode_path(self._names[self._name_offsets[index]:self._name_offsets[index + 1]])
+        return self._prefixes[self._entry_prefixes[index]] + name
+
+    def digest(self, index):
+        """Get binary digest of an entry.
+
+        :param index: Index of the entry.
+        :type index: int
+        :returns: Binary SHA1 digest.
+        :rtype: bytes
+        """
+        offset = index * self.digest_size
+        return bytes(self._digests[offset:offset + self.digest_size])
+
+    def items(self):
+        """Iterate paths and hex digests.
+
+        :returns: Pairs of path and hex digest.
+        :rtype: tuple
+        """
+        for index in range(len(self)):
+            yield self.path(index), binascii.hexlify(self.digest(index)).decode('ascii')
+
+    def path_of(self, hexdigest):
+        """Find path of a file by its digest.
+
+        :param hexdigest: Hex SHA1 digest.
+        :type hexdigest: str
+        :returns: Path relative to deployed folder.
+        :rtype: str
+        :raises KeyError: If no file has the digest.
+        """
+        try:
+            digest = binascii.unhexlify(hexdigest)
+        except (binascii.Error, TypeError):
+            raise KeyError(hexdigest)
+        if len(digest) != self.digest_size:
+            raise KeyError(hexdigest)
+        if self._table is None:
+            self._build_table()
+        mask = len(self._table) - 1
+        slot = self._slot(digest) & mask
+        while self._table[slot]:
+            index = self._table[slot] - 1
+            if self.digest(index) == digest:
+                return self.path(index)
+            slot = (slot + 1) & mask
+        raise KeyError(hexdigest)
+
+    def _slot(self, digest):
+        return struct.unpack_from('<L', digest)[0]
+
+    def _build_table(self):
+        # Keep load factor at most 0.5. Slots hold entry index + 1, 0 is empty.
+        size = 1
+        while size < 2 * len(self):
+            size *= 2
+        table = array('I', [0]) * size
+        mask = size - 1
+        for index in range(len(self)):
+            slot = self._slot(self.digest(index)) & mask
+            while table[slot]:
+                slot = (slot + 1) & mask
+            table[slot] = index + 1
+        self._table = table
+
+
 class APIRequest:
 
     base_url = 'https://api.netlify.com/api/'
     api_version = 'v1'
+    deploys_per_page = 100
+    compress_manifest = False
+    connect_timeout = 10
+    read_timeout = 60
+    hedge_gets = False
+    hedge_after = None
+    hedge_percentile = 95
+    hedge_median_multiple = 3
+    hedge_min_samples = 20
+    latency_window = 100
     headers = {'User-Agent': 'PyNetlify (toni.sissala@gmail.com)'}
 
-    def __init__(self, auth_token):
+    def __init__(self, auth_token, compress_manifest=None,
+                 connect_timeout=None, read_timeout=None, hedge_gets=None,
+                 hedge_after=None):
         """Initialize an APIRequest object.
 
         :param auth_token: Authentication token.
         :type auth_token: str
+        :param compress_manifest: Send deploy manifest gzip compressed.
+        :type compress_manifest: bool
+        :param connect_timeout: Seconds to wait for a connection.
+        :type connect_timeout: float
+        :param read_timeout: Seconds to wait between bytes of a response.
+        :type read_timeout: float
+        :param hedge_gets: Send a duplicate of a slow idempotent GET request.
+        :type hedge_gets: bool
+        :param hedge_after: Seconds after which a GET request gets hedged
+                            until enough latencies have been measured.
+        :type hedge_after: float
         """
         self._auth_token = auth_token
+        if compress_manifest is not None:
+            self.compress_manifest = compress_manifest
+        if connect_timeout is not None:
+            self.connect_timeout = connect_timeout
+        if read_timeout is not None:
+            self.read_timeout = read_timeout
+        if hedge_gets is not None:
+            self.hedge_gets = hedge_gets
+        if hedge_after is not None:
+            self.hedge_after = hedge_after
+        # Latencies per endpoint, response sizes differ between endpoints.
+        self._latencies = {}
+        self._latencies_lock = threading.Lock()
+
+    @property
+    def timeout(self):
+        """Timeout passed to every request.
+
+        :returns: Connect and read timeouts.
+        :rtype: tuple
+        """
+        return (self.connect_timeout, self.read_timeout)
+
+    def hedge_delay(self, endpoint):
+        """Get delay after which a GET request to an endpoint gets
+        hedged. The delay is the :attr:`hedge_percentile` of recent
+        latencies of the endpoint, capped at :attr:`hedge_median_multiple`
+        times their median. The cap keeps a few latency spikes in the
+        window from raising the delay to spike latency, where spikes
+        would no longer get hedged.
+
+        :param endpoint: Name of the endpoint.
+        :type endpoint: str
+        :returns: Delay in seconds. :attr:`hedge_after` if there are too
+                  few samples.
+        :rtype: float or None
+        """
+        with self._latencies_lock:
+            latencies = sorted(self._latencies.get(endpoint, ()))
+        if len(latencies) < self.hedge_min_samples:
+            return self.hedge_after
+        rank = int(math.ceil(self.hedge_percentile / 100.0 * len(latencies)))
+        median = latencies[(len(latencies) - 1) // 2]
+        return min(latencies[max(rank, 1) - 1], median * self.hedge_median_multiple)
+
+    def _record_latency(self, endpoint, latency):
+        with self._latencies_lock:
+            if endpoint not in self._latencies:
+                self._latencies[endpoint] = deque(maxlen=self.latency_window)
+            self._latencies[endpoint].append(latency)
+
+    def _get(self, endpoint, url, **kwargs):
+        """Send an idempotent GET request. If hedging is enabled and
+        no response arrives within :meth:`hedge_delay`, send a
+        duplicate request and return whichever response arrives first.
+        """
+        kwargs.update({'headers': self.headers, 'timeout': self.timeout})
+        delay = self.hedge_delay(endpoint) if self.hedge_gets else None
+        if delay is None:
+            start = time.time()
+            response = requests.get(url, **kwargs)
+            self._record_latency(endpoint, time.time() - start)
+            return response
+        return self._hedged_get(endpoint, url, delay, **kwargs)
+
+    def _hedged_get(self, endpoint, url, delay, **kwargs):
+        """Send a GET request and a duplicate of it if no response
+        arrives within delay. Responses that lose the race get closed.
+        """
+        results = queue.Queue()
+        lock = threading.Lock()
+        state = {'done': False}
+        start = time.time()
+
+        def attempt():
+            try:
+                result = (requests.get(url, **kwargs), None)
+            except Exception as exc:
+                result = (None, exc)
+            with lock:
+                if not state['done']:
+                    results.put(result)
+                    return
+            if result[0] is not None:
+                result[0].close()
+
+        def start_attempt():
+            thread = threading.Thread(target=attempt)
+            thread.daemon = True
+            thread.start()
+
+        start_attempt()
+        attempts = 1
+        response = None
+        try:
+            try:
+                response, exc = results.get(timeout=delay)
+            except queue.Empty:
+                logger.debug('Hedging GET request after %.3f seconds', delay)
+                start_attempt()
+                attempts += 1
+                response, exc = results.get()
+            if exc is not None and attempts == 1:
+                raise exc
+            if exc is not None:
+                # The other attempt may still succeed.
+                response, exc = results.get()
+                if exc is not None:
+                    raise exc
+        finally:
+            with lock:
+                state['done'] = True
+            # Close a losing response that arrived before done was set.
+            while True:
+                try:
+                    loser, _ = results.get_nowait()
+                except queue.Empty:
+                    break
+                if loser is not None and loser is not response:
+                    loser.close()
+        self._record_latency(endpoint, time.time() - start)
+        return response
 
     def _auth_url(self, *p):
         if self.api_version is not None:
@@ -94,7 +554,7 @@ class APIRequest:
         :rtype: :obj:`Site`
         """
         url = self._auth_url('sites', site_id_or_domain)
-        response = requests.get(url, headers=self.headers)
+        response = self._get('site', url)
         response.raise_for_status()
         response_json = response.json()
         logger.debug(pprint.pformat(response_json))
@@ -109,7 +569,7 @@ class APIRequest:
         :rtype: list
         """
         url = self._auth_url('sites', site.id, 'files')
-        response = requests.get(url, headers=self.headers)
+        response = self._get('site_files', url)
         response.raise_for_status()
         response_json = response.json()
         logger.debug(pprint.pformat(response_json))
@@ -122,7 +582,7 @@ class APIRequest:
         :rtype: :obj:`Site`
         """
         url = self._auth_url('sites')
-        response = requests.get(url, headers=self.headers)
+        response = self._get('sites', url)
         response.raise_for_status()
         for site in response.json():
             yield rdict_to_site(site)
@@ -136,7 +596,8 @@ class APIRequest:
         :returns: Created site.
         :rtype: :obj:`Site`
         """
-        response = requests.post(self._auth_url('sites'), json=site_properties, headers=self.headers)
+        response = requests.post(self._auth_url('sites'), json=site_properties,
+                                 headers=self.headers, timeout=self.timeout)
         response.raise_for_status()
         if response.status_code != 201:
             logger.warning('Unexpected response status code %s'
@@ -152,67 +613,84 @@ class APIRequest:
         :rtype: bool
         """
         url = self._auth_url('sites', site.id)
-        response = requests.delete(url, headers=self.headers)
+        response = requests.delete(url, headers=self.headers, timeout=self.timeout)
         response.raise_for_status()
         if response.status_code != 204:
             logger.warning('Unexpected response status code %s'
                            % (response.status_code,))
         return True
 
-    def deploy_folder_to_site(self, folder, site):
+    def deploy_folder_to_site(self, folder, site, timeline=None):
         """Deploy a folder to a site.
 
         :param folder: Path to a folder.
         :type folder: str
         :param site: Site to deploy to.
         :type site: :obj:`Site`
+        :param timeline: Timeline to record deploy phases and files to.
+        :type timeline: :obj:`Timeline`
         :returns: None if nothing gets deployed. Deploy id if files get deployed.
         :rtype: None or int
         """
+        timeline = NullTimeline() if timeline is None else timeline
         folder = folder + os.sep if not folder.endswith(os.sep) else folder
-        files_hashes = {}
-        for filepath in iterate_folder_filepaths(folder):
-            if not os.path.isfile(filepath):
-                continue
-            logger.debug('Preparing hash of %s', filepath)
-            with open(filepath, 'rb') as filehandle:
-                files_hashes.update({
-                    filepath.replace(folder, '', 1):
-                    hashlib.sha1(filehandle.read()).hexdigest()
-                })
-        if files_hashes == {}:
+        manifest = Manifest()
+        with timeline.span('walk_and_hash', 'phase') as phase:
+            filepaths = (filepath for filepath in iterate_folder_filepaths(folder)
+                         if os.path.isfile(filepath))
+            for filepath in timeline.timed_iter(filepaths, phase, 'walk_seconds'):
+                logger.debug('Preparing hash of %s', filepath)
+                relative_path = filepath[len(folder):]
+                with timeline.span('read_and_hash', 'file', path=relative_path) as span:
+                    with open(filepath, 'rb') as filehandle:
+                        contents = filehandle.read()
+                    manifest.add(relative_path, hashlib.sha1(contents).digest())
+                    span['bytes'] = len(contents)
+            phase['files'] = len(manifest)
+        if not manifest:
             # TODO Should we POST anyway to delete all previously deployed files?
             logger.warning('Found no files from path %s', (folder,))
             return None
-        logger.debug('Requesting required hashes of files %s',
-                     ', '.join(files_hashes.keys()))
-        response = requests.post(self._auth_url('sites',
-                                                site.id,
-                                                'deploys'),
-                                 json={'files': files_hashes},
-                                 headers=self.headers)
-        response.raise_for_status()
-        response_json = response.json()
+        logger.debug('Requesting required hashes of %s files',
+                     len(manifest))
+        manifest_headers = self.headers.copy()
+        manifest_headers.update({'Content-Type': 'application/json'})
+        manifest_body = iter_manifest_json(manifest)
+        if self.compress_manifest:
+            manifest_headers.update({'Content-Encoding': 'gzip'})
+            manifest_body = iter_gzip(manifest_body)
+        with timeline.span('manifest', 'phase', files=len(manifest)):
+            response = requests.post(self._auth_url('sites',
+                                                    site.id,
+                                                    'deploys'),
+                                     data=manifest_body,
+                                     headers=manifest_headers,
+                                     timeout=self.timeout)
+            response.raise_for_status()
+            response_json = response.json()
         logger.debug(pprint.pformat(response_json))
         deploy_id = response_json['id']
         required_hashes = response_json['required']
         logger.debug('Required filehashes: %s', required_hashes)
         if not required_hashes:
             return deploy_id
-        hashes_files = {value: key for (key, value) in files_hashes.items()}
 
         deploy_headers = self.headers.copy()
         deploy_headers.update({'Content-Type': 'application/octet-stream'})
-        for required_hash in required_hashes:
-            filepath = folder + hashes_files[required_hash]
-            with open(filepath, 'rb') as filehandle:
-                response = requests.put(
-                    self._auth_url('deploys',
-                                   deploy_id, 'files',
-                                   quote_url(hashes_files[required_hash])),
-                    data=filehandle,
-                    headers=deploy_headers)
-                response.raise_for_status()
+        with timeline.span('upload', 'phase', files=len(required_hashes)):
+            for required_hash in required_hashes:
+                relative_path = manifest.path_of(required_hash)
+                with timeline.span('upload', 'file', path=relative_path) as span, \
+                        open(folder + relative_path, 'rb') as filehandle:
+                    span['bytes'] = os.fstat(filehandle.fileno()).st_size
+                    response = requests.put(
+                        self._auth_url('deploys',
+                                       deploy_id, 'files',
+                                       quote_url(relative_path)),
+                        data=filehandle,
+                        headers=deploy_headers,
+                        timeout=self.timeout)
+                    response.raise_for_status()
         return deploy_id
 
     def get_deploy(self, deploy_id):
@@ -223,8 +701,46 @@ class APIRequest:
         :rtype: dict
         """
         url = self._auth_url('deploys', deploy_id)
-        response = requests.get(url, headers=self.headers)
+        response = self._get('deploy', url)
         response.raise_for_status()
         response_json = response.json()
         logger.debug(pprint.pformat(response_json))
         return response.json()
+
+    def list_deploys(self, site):
+        """Iterate deploys of a site, newest first. Fetches
+        one page of deploys at a time.
+
+        :param site: Site to list deploys from.
+        :type site: :obj:`Site`
+        :returns: Deploys one by one.
+        :rtype: :obj:`Deploy`
+        """
+        url = self._auth_url('sites', site.id, 'deploys')
+        page = 1
+        while True:
+            response = self._get('deploys', url, params={'page': page,
+                                                         'per_page': self.deploys_per_page})
+            response.raise_for_status()
+            response_json = response.json()
+            for deploy in response_json:
+                yield rdict_to_deploy(deploy)
+            if len(response_json) < self.deploys_per_page:
+                break
+            page += 1
+
+    def restore_deploy(self, site, deploy_id):
+        """Restore a previous deploy. Publishes an already uploaded
+        deploy as the live version of the site.
+
+        :param site: Site the deploy belongs to.
+        :type site: :obj:`Site`
+        :param deploy_id: ID of the deploy to restore.
+        :type deploy_id: str
+        :returns: Restored deploy.
+        :rtype: :obj:`Deploy`
+        """
+        url = self._auth_url('sites', site.id, 'deploys', deploy_id, 'restore')
+        response = requests.post(url, headers=self.headers, timeout=self.timeout)
+        response.raise_for_status()
+        return rdict_to_deploy(response.json())
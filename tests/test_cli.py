@@ -1,5 +1,8 @@
 import sys
+import json
+import threading
 import unittest
+from tempfile import NamedTemporaryFile
 from pynetlify import cli
 
 running_python2 = sys.version_info[0] == 2
@@ -48,6 +51,109 @@ class CliOperationsTest(unittest.TestCase):
         self.mock_netlify_api.delete_site.assert_has_calls([
             mock.call('site_1'), mock.call('site_2')])
 
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_list_deploys_prints_deploys(self, mock_stdout):
+        self.mock_netlify_api.list_deploys.return_value = ['deploy1', 'deploy2']
+        cli.list_deploys(self.mock_netlify_api, mock.Mock(site_id='some_id'))
+        self.mock_netlify_api.list_deploys.assert_called_once_with(
+            cli.pynetlify.Site(name=None, url=None, id='some_id'))
+        self.assertEqual(mock_stdout.getvalue(), 'deploy1\ndeploy2\n')
+
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_rollback_calls_restore_deploy(self, mock_stdout):
+        cli.rollback(self.mock_netlify_api, mock.Mock(site_id='some_id', deploy_id='dep_id'))
+        self.mock_netlify_api.restore_deploy.assert_called_once_with(
+            cli.pynetlify.Site(name=None, url=None, id='some_id'), 'dep_id')
+
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_deploy_folder_writes_trace(self, mock_stdout):
+        self.mock_netlify_api.deploy_folder_to_site.return_value = 'dep_id'
+        self.mock_netlify_api.get_deploy.return_value = {'state': 'ready'}
+        trace_file = NamedTemporaryFile(mode='r', suffix='.json')
+        cli.deploy_folder(self.mock_netlify_api, mock.Mock(
+            site_id='some_id', folder='/some/path',
+            trace=trace_file.name))
+        _, kwargs = self.mock_netlify_api.deploy_folder_to_site.call_args
+        self.assertIsInstance(kwargs['timeline'], cli.pynetlify.Timeline)
+        trace = json.load(trace_file)
+        self.assertEqual([event['name'] for event in trace['traceEvents'] if event['ph'] == 'X'],
+                         ['get_site', 'poll', 'wait_ready'])
+
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_deploy_folder_writes_trace_when_deploy_fails(self, mock_stdout):
+        self.mock_netlify_api.deploy_folder_to_site.side_effect = ValueError('deploy failed')
+        trace_file = NamedTemporaryFile(mode='r', suffix='.json')
+        with self.assertRaises(ValueError):
+            cli.deploy_folder(self.mock_netlify_api, mock.Mock(
+                site_id='some_id', folder='/some/path', trace=trace_file.name))
+        trace = json.load(trace_file)
+        self.assertEqual([event['name'] for event in trace['traceEvents'] if event['ph'] == 'X'],
+                         ['get_site'])
+
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    @mock.patch.object(cli.pynetlify.Timeline, 'dump')
+    def test_deploy_folder_trace_dump_error_does_not_hide_deploy_error(self, mock_dump, mock_stdout):
+        mock_dump.side_effect = IOError('disk full')
+        self.mock_netlify_api.deploy_folder_to_site.side_effect = ValueError('deploy failed')
+        trace_file = NamedTemporaryFile(mode='r', suffix='.json')
+        with mock.patch.object(cli.logging, 'exception'):
+            with self.assertRaises(ValueError):
+                cli.deploy_folder(self.mock_netlify_api, mock.Mock(
+                    site_id='some_id', folder='/some/path', trace=trace_file.name))
+
+    def test_deploy_folder_unwritable_trace_fails_before_deploy(self):
+        with self.assertRaises((IOError, OSError)):
+            cli.deploy_folder(self.mock_netlify_api, mock.Mock(
+                site_id='some_id', folder='/some/path',
+                trace='/nonexistent-directory/trace.json'))
+        self.mock_netlify_api.get_site.assert_not_called()
+
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_deploy_folder_without_trace_uses_null_timeline(self, mock_stdout):
+        self.mock_netlify_api.deploy_folder_to_site.return_value = None
+        cli.deploy_folder(self.mock_netlify_api, mock.Mock(
+            site_id='some_id', folder='/some/path',
+            trace=None))
+        _, kwargs = self.mock_netlify_api.deploy_folder_to_site.call_args
+        self.assertIsInstance(kwargs['timeline'], cli.pynetlify.NullTimeline)
+
+
+class CliMainTest(unittest.TestCase):
+
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    @mock.patch.object(cli.pynetlify.APIRequest, 'deploy_folder_to_site')
+    @mock.patch.object(cli.pynetlify, 'requests')
+    def test_hedge_after_duplicates_slow_deploy_poll(self, mock_requests,
+                                                     mock_deploy_folder_to_site,
+                                                     mock_stdout):
+        mock_deploy_folder_to_site.return_value = 'dep_id'
+        site_response = mock.Mock()
+        site_response.json.return_value = {'name': 'site', 'id': 'site_id', 'url': 'site_url'}
+        slow_response = mock.Mock()
+        slow_response.json.return_value = {'state': 'building'}
+        fast_response = mock.Mock()
+        fast_response.json.return_value = {'state': 'ready'}
+        release_slow = threading.Event()
+        deploy_calls = []
+
+        def get(url, **kwargs):
+            if '/sites/' in url:
+                return site_response
+            deploy_calls.append(url)
+            if len(deploy_calls) == 1:
+                release_slow.wait(5)
+                return slow_response
+            return fast_response
+        mock_requests.get.side_effect = get
+        argv = ['pynetlify', '--auth-token', 'token', '--hedge-after', '0.01',
+                'deploy_folder', '--site-id', 'site_id', '/some/path']
+        with mock.patch.object(sys, 'argv', argv):
+            rval = cli.cli_main()
+        release_slow.set()
+        self.assertEqual(rval, 0)
+        self.assertEqual(len(deploy_calls), 2)
+        self.assertIn('Site deployed and live at site_url', mock_stdout.getvalue())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,4 +1,10 @@
+import os
 import sys
+import json
+import hashlib
+import binascii
+import zlib
+import threading
 import unittest
 from tempfile import NamedTemporaryFile
 from pynetlify import pynetlify
@@ -43,7 +49,8 @@ class TestAPIRequests(APIRequestTestBase):
         site = self._api.get_site('some_site_id')
         self._mock_requests.get.assert_called_once_with(
             self._netlify_api_url + 'sites/some_site_id?access_token={}'.format('auth-token'),
-            headers=self._api.headers)
+            headers=self._api.headers,
+            timeout=self._api.timeout)
         self.assertEqual(site, pynetlify.rdict_to_site(self._test_sites[0]))
 
     def test_get_site_files(self):
@@ -53,7 +60,8 @@ class TestAPIRequests(APIRequestTestBase):
         files = self._api.get_site_files(pynetlify.Site(id='some_site_id', name=None, url=None))
         self._mock_requests.get.assert_called_once_with(
             self._netlify_api_url + 'sites/some_site_id/files?access_token={}'.format('auth-token'),
-            headers=self._api.headers)
+            headers=self._api.headers,
+            timeout=self._api.timeout)
         self.assertEqual(files, ['file.html', 'other_file.html'])
 
     def test_sites(self):
@@ -66,7 +74,8 @@ class TestAPIRequests(APIRequestTestBase):
         # Assert
         self._mock_requests.get.assert_called_once_with(
             self._netlify_api_url + 'sites?access_token={}'.format('auth-token'),
-            headers=self._api.headers)
+            headers=self._api.headers,
+            timeout=self._api.timeout)
         self.assertEqual(len(sites), 2)
         if running_python2:
             self.assertItemsEqual(sites, [
@@ -90,6 +99,7 @@ class TestAPIRequests(APIRequestTestBase):
         self._mock_requests.post.assert_called_once_with(
             self._netlify_api_url + 'sites?access_token={}'.format('auth-token'),
             headers=self._api.headers,
+            timeout=self._api.timeout,
             json={'prop_1': 'val_1',
                   'prop_2': 'val_2'})
         self.assertEqual(rval, pynetlify.rdict_to_site(self._test_sites[0]))
@@ -98,7 +108,8 @@ class TestAPIRequests(APIRequestTestBase):
         rval = self._api.delete_site(pynetlify.Site(id='del_id', name=None, url='some.url'))
         self._mock_requests.delete.assert_called_once_with(
             self._netlify_api_url + 'sites/del_id?access_token={}'.format('auth-token'),
-            headers=self._api.headers)
+            headers=self._api.headers,
+            timeout=self._api.timeout)
         self.assertEqual(rval, True)
 
     def test_get_deploy(self):
@@ -108,9 +119,146 @@ class TestAPIRequests(APIRequestTestBase):
         deploy = self._api.get_deploy('some_deploy_id')
         self._mock_requests.get.assert_called_once_with(
             self._netlify_api_url + 'deploys/some_deploy_id?access_token={}'.format('auth-token'),
-            headers=self._api.headers)
+            headers=self._api.headers,
+            timeout=self._api.timeout)
         self.assertEqual(deploy, {'deploy': 'deploy_id'})
 
+    def test_list_deploys(self):
+        mock_response = mock.Mock()
+        mock_response.json.return_value = [{'id': 'dep_1', 'site_id': 'site_id', 'state': 'ready',
+                                            'created_at': '2019-01-01T00:00:00Z', 'title': None}]
+        self._mock_requests.get.return_value = mock_response
+        deploys = list(self._api.list_deploys(pynetlify.Site(id='site_id', name=None, url=None)))
+        self._mock_requests.get.assert_called_once_with(
+            self._netlify_api_url + 'sites/site_id/deploys?access_token={}'.format('auth-token'),
+            headers=self._api.headers,
+            timeout=self._api.timeout,
+            params={'page': 1, 'per_page': self._api.deploys_per_page})
+        self.assertEqual(deploys, [pynetlify.Deploy(id='dep_1', site_id='site_id', state='ready',
+                                                    created_at='2019-01-01T00:00:00Z', title=None)])
+
+    def test_list_deploys_fetches_next_page_when_page_is_full(self):
+        self._api.deploys_per_page = 2
+        full_page = mock.Mock()
+        full_page.json.return_value = [{'id': 'dep_1'}, {'id': 'dep_2'}]
+        last_page = mock.Mock()
+        last_page.json.return_value = [{'id': 'dep_3'}]
+        self._mock_requests.get.side_effect = [full_page, last_page]
+        deploys = list(self._api.list_deploys(pynetlify.Site(id='site_id', name=None, url=None)))
+        self.assertEqual(self._mock_requests.get.call_count, 2)
+        _, kwargs = self._mock_requests.get.call_args
+        self.assertEqual(kwargs['params'], {'page': 2, 'per_page': 2})
+        self.assertEqual([deploy.id for deploy in deploys], ['dep_1', 'dep_2', 'dep_3'])
+
+    def test_restore_deploy(self):
+        mock_response = mock.Mock()
+        mock_response.json.return_value = {'id': 'dep_1', 'site_id': 'site_id', 'state': 'ready'}
+        self._mock_requests.post.return_value = mock_response
+        deploy = self._api.restore_deploy(pynetlify.Site(id='site_id', name=None, url=None), 'dep_1')
+        self._mock_requests.post.assert_called_once_with(
+            self._netlify_api_url + 'sites/site_id/deploys/dep_1/restore?access_token={}'.format('auth-token'),
+            headers=self._api.headers,
+            timeout=self._api.timeout)
+        self.assertEqual(deploy.id, 'dep_1')
+        self.assertEqual(deploy.state, 'ready')
+
+    def test_timeout_is_configurable(self):
+        api = pynetlify.APIRequest('auth-token', connect_timeout=1, read_timeout=2)
+        api.delete_site(pynetlify.Site(id='del_id', name=None, url=None))
+        _, kwargs = self._mock_requests.delete.call_args
+        self.assertEqual(kwargs['timeout'], (1, 2))
+
+
+class TestAPIRequestsHedging(APIRequestTestBase):
+
+    def setUp(self):
+        super(TestAPIRequestsHedging, self).setUp()
+        self._api = pynetlify.APIRequest('auth-token', hedge_gets=True)
+        self._api.hedge_min_samples = 5
+        self._slow_response = mock.Mock()
+        self._slow_response.json.return_value = {'id': 'slow'}
+        self._fast_response = mock.Mock()
+        self._fast_response.json.return_value = {'id': 'fast'}
+
+    def _fill_latencies(self, latency=0.01):
+        for _ in range(self._api.hedge_min_samples):
+            self._api._record_latency('deploy', latency)
+
+    def test_hedge_delay_is_none_without_samples(self):
+        self.assertIsNone(self._api.hedge_delay('deploy'))
+
+    def test_hedge_delay_is_hedge_after_without_samples(self):
+        self._api.hedge_after = 0.5
+        self.assertEqual(self._api.hedge_delay('deploy'), 0.5)
+        self._fill_latencies()
+        self.assertEqual(self._api.hedge_delay('deploy'), 0.01)
+
+    def test_hedge_delay_is_per_endpoint(self):
+        self._fill_latencies()
+        self.assertEqual(self._api.hedge_delay('deploy'), 0.01)
+        self.assertIsNone(self._api.hedge_delay('site_files'))
+
+    def test_hedge_delay_is_percentile_of_latencies(self):
+        self._api.hedge_percentile = 80
+        for latency in (0.5, 0.1, 0.4, 0.2, 0.3):
+            self._api._record_latency('deploy', latency)
+        self.assertEqual(self._api.hedge_delay('deploy'), 0.4)
+
+    def test_hedge_delay_is_capped_at_median_multiple(self):
+        for latency in [0.01] * 17 + [0.5] * 3:
+            self._api._record_latency('deploy', latency)
+        self.assertEqual(self._api.hedge_delay('deploy'), 0.01 * self._api.hedge_median_multiple)
+
+    def test_get_is_not_hedged_without_samples(self):
+        self._mock_requests.get.return_value = self._fast_response
+        self._api.get_deploy('dep_id')
+        self.assertEqual(self._mock_requests.get.call_count, 1)
+        self.assertEqual(len(self._api._latencies['deploy']), 1)
+
+    def test_slow_get_is_hedged_and_first_response_wins(self):
+        self._fill_latencies()
+        release_slow = threading.Event()
+
+        def get(url, **kwargs):
+            if self._mock_requests.get.call_count == 1:
+                release_slow.wait(5)
+                return self._slow_response
+            return self._fast_response
+        self._mock_requests.get.side_effect = get
+        deploy = self._api.get_deploy('dep_id')
+        release_slow.set()
+        self.assertEqual(self._mock_requests.get.call_count, 2)
+        self.assertEqual(deploy, {'id': 'fast'})
+
+    def test_losing_response_is_closed(self):
+        self._fill_latencies()
+        release_slow = threading.Event()
+        slow_closed = threading.Event()
+        self._slow_response.close.side_effect = slow_closed.set
+
+        def get(url, **kwargs):
+            if self._mock_requests.get.call_count == 1:
+                release_slow.wait(5)
+                return self._slow_response
+            return self._fast_response
+        self._mock_requests.get.side_effect = get
+        self._api.get_deploy('dep_id')
+        release_slow.set()
+        self.assertTrue(slow_closed.wait(5))
+        self._fast_response.close.assert_not_called()
+
+    def test_fast_get_is_not_hedged(self):
+        self._fill_latencies(latency=5)
+        self._mock_requests.get.return_value = self._fast_response
+        self._api.get_deploy('dep_id')
+        self.assertEqual(self._mock_requests.get.call_count, 1)
+
+    def test_failed_get_raises(self):
+        self._fill_latencies(latency=5)
+        self._mock_requests.get.side_effect = ValueError('failed')
+        with self.assertRaises(ValueError):
+            self._api.get_deploy('dep_id')
+
 
 class TestAPIRequestsDeploy(APIRequestTestBase):
 
@@ -140,7 +288,28 @@ class TestAPIRequestsDeploy(APIRequestTestBase):
         self._api.deploy_folder_to_site('/tmp', mock.Mock(id='some_other_id'))
         self.assertEqual(self._mock_requests.post.call_count, 1)
         _, kwargs = self._mock_requests.post.call_args
-        self.assertEqual(list(kwargs['json']['files'].keys())[0], stripped_name)
+        manifest = json.loads(b''.join(kwargs['data']).decode('utf-8'))
+        self.assertEqual(list(manifest['files'].keys())[0], stripped_name)
+        self.assertNotIn('Content-Encoding', kwargs['headers'])
+
+    @mock.patch.object(pynetlify.os, 'walk')
+    @mock.patch.object(pynetlify, 'glob')
+    def test_deploy_folder_to_site_posts_compressed_manifest(self,
+                                                             mock_glob,
+                                                             mock_walk):
+        tempfile = NamedTemporaryFile()
+        stripped_name = tempfile.name.replace('/tmp/', '', 1)
+        if running_python2:
+            mock_walk.return_value = [('/tmp', [], [tempfile.name])]
+        else:
+            mock_glob.iglob.return_value = [tempfile.name]
+        api = pynetlify.APIRequest('auth-token', compress_manifest=True)
+        api.deploy_folder_to_site('/tmp', mock.Mock(id='some_other_id'))
+        _, kwargs = self._mock_requests.post.call_args
+        self.assertEqual(kwargs['headers']['Content-Encoding'], 'gzip')
+        payload = zlib.decompress(b''.join(kwargs['data']), 16 + zlib.MAX_WBITS)
+        manifest = json.loads(payload.decode('utf-8'))
+        self.assertEqual(list(manifest['files'].keys())[0], stripped_name)
 
     @mock.patch.object(pynetlify, 'hashlib')
     @mock.patch.object(pynetlify.os, 'walk')
@@ -150,11 +319,11 @@ class TestAPIRequestsDeploy(APIRequestTestBase):
                                                      mock_walk,
                                                      mock_hashlib):
         mock_hash = mock.Mock()
-        mock_hash.hexdigest.return_value = 'some_hash'
+        mock_hash.digest.return_value = b'\x01' * 20
         mock_hashlib.sha1.return_value = mock_hash
         mock_response = mock.Mock()
         mock_response.json.return_value = {'id': 'dep_id',
-                                           'required': ['some_hash']}
+                                           'required': ['01' * 20]}
         tempfile = NamedTemporaryFile()
         expected_url = self._netlify_api_url +\
             'deploys/dep_id/files/{}?access_token={}'\
@@ -172,6 +341,160 @@ class TestAPIRequestsDeploy(APIRequestTestBase):
         self.assertEqual(url, expected_url)
         self.assertEqual(rval, 'dep_id')
 
+    @mock.patch.object(pynetlify.os, 'walk')
+    @mock.patch.object(pynetlify, 'glob')
+    def test_deploy_folder_to_site_records_timeline(self,
+                                                    mock_glob,
+                                                    mock_walk):
+        tempfile = NamedTemporaryFile()
+        tempfile.write(b'contents')
+        tempfile.flush()
+        mock_response = mock.Mock()
+        mock_response.json.return_value = {'id': 'dep_id',
+                                           'required': [hashlib.sha1(b'contents').hexdigest()]}
+        self._mock_requests.post.return_value = mock_response
+        if running_python2:
+            mock_walk.return_value = [('/tmp', [], [tempfile.name])]
+        else:
+            mock_glob.iglob.return_value = [tempfile.name]
+        timeline = pynetlify.Timeline()
+        self._api.deploy_folder_to_site('/tmp', mock.Mock(id='some_other_id'), timeline=timeline)
+        self.assertEqual([(event.category, event.name) for event in timeline.events],
+                         [('file', 'read_and_hash'), ('phase', 'walk_and_hash'),
+                          ('phase', 'manifest'),
+                          ('file', 'upload'), ('phase', 'upload')])
+        for event in timeline.events:
+            self.assertLessEqual(event.start, event.end)
+        self.assertEqual(timeline.events[0].args['bytes'], len(b'contents'))
+        self.assertGreaterEqual(timeline.events[1].args['walk_seconds'], 0)
+        self.assertEqual(timeline.events[1].args['files'], 1)
+        self.assertEqual(timeline.events[3].args['bytes'], len(b'contents'))
+        self.assertEqual(timeline.events[3].args['path'], tempfile.name.replace('/tmp/', '', 1))
+
+
+class TestManifestEncoding(unittest.TestCase):
+
+    _files_hashes = {'index.html': 'a' * 40,
+                     'sub/"quoted".html': 'b' * 40,
+                     u'sub/\u00e4.css': 'c' * 40}
+
+    def test_iter_manifest_json_matches_json_dumps(self):
+        payload = b''.join(pynetlify.iter_manifest_json(self._files_hashes))
+        self.assertEqual(json.loads(payload.decode('utf-8')), {'files': self._files_hashes})
+
+    def test_iter_manifest_json_yields_chunks(self):
+        chunks = list(pynetlify.iter_manifest_json(self._files_hashes, chunk_size=1))
+        self.assertEqual(len(chunks), len(self._files_hashes) + 1)
+
+    def test_iter_manifest_json_empty(self):
+        payload = b''.join(pynetlify.iter_manifest_json({}))
+        self.assertEqual(json.loads(payload.decode('utf-8')), {'files': {}})
+
+    def test_iter_gzip_roundtrip(self):
+        chunks = [b'first chunk ', b'second chunk']
+        compressed = b''.join(pynetlify.iter_gzip(chunks))
+        self.assertEqual(zlib.decompress(compressed, 16 + zlib.MAX_WBITS), b''.join(chunks))
+
+
+class TestTimeline(unittest.TestCase):
+
+    def test_span_records_event(self):
+        timeline = pynetlify.Timeline()
+        with timeline.span('upload', 'file', path='index.html') as args:
+            args['bytes'] = 10
+        event, = timeline.events
+        self.assertEqual(event.name, 'upload')
+        self.assertEqual(event.category, 'file')
+        self.assertEqual(event.args, {'path': 'index.html', 'bytes': 10})
+        self.assertEqual(event.worker, threading.current_thread().name)
+        self.assertLessEqual(event.start, event.end)
+
+    def test_span_records_event_on_exception(self):
+        timeline = pynetlify.Timeline()
+        with self.assertRaises(ValueError):
+            with timeline.span('manifest', 'phase'):
+                raise ValueError('failed')
+        self.assertEqual(len(timeline.events), 1)
+
+    def test_to_chrome_trace(self):
+        timeline = pynetlify.Timeline()
+        timeline.events.append(pynetlify.TimelineEvent(
+            name='hash', category='file', start=timeline.origin + 1,
+            end=timeline.origin + 1.5, worker='MainThread', args={'bytes': 1}))
+        trace_events = timeline.to_chrome_trace()['traceEvents']
+        self.assertEqual(trace_events[0]['ph'], 'M')
+        self.assertEqual(trace_events[0]['args'], {'name': 'MainThread'})
+        self.assertEqual(trace_events[1]['ph'], 'X')
+        self.assertEqual(trace_events[1]['ts'], 1e6)
+        self.assertEqual(trace_events[1]['dur'], 0.5e6)
+        self.assertEqual(trace_events[1]['tid'], trace_events[0]['tid'])
+
+    def test_timed_iter_adds_time_to_args(self):
+        timeline = pynetlify.Timeline()
+        args = {}
+        self.assertEqual(list(timeline.timed_iter(iter([1, 2]), args, 'walk_seconds')), [1, 2])
+        self.assertGreaterEqual(args['walk_seconds'], 0)
+
+    def test_null_timeline_timed_iter_returns_iterable(self):
+        iterable = iter([1, 2])
+        args = {}
+        self.assertIs(pynetlify.NullTimeline().timed_iter(iterable, args, 'walk_seconds'), iterable)
+        self.assertEqual(args, {})
+
+    def test_null_timeline_records_nothing(self):
+        timeline = pynetlify.NullTimeline()
+        with timeline.span('hash', 'file', path='index.html') as args:
+            args['bytes'] = 10
+        self.assertEqual(list(timeline.events), [])
+
+
+class TestManifest(unittest.TestCase):
+
+    def setUp(self):
+        self._manifest = pynetlify.Manifest()
+        self._files = [('index.html', hashlib.sha1(b'index').digest()),
+                       (os.path.join('sub', 'index.html'), hashlib.sha1(b'sub').digest()),
+                       (os.path.join('sub', 'style.css'), hashlib.sha1(b'style').digest())]
+        for path, digest in self._files:
+            self._manifest.add(path, digest)
+
+    def test_len(self):
+        self.assertEqual(len(self._manifest), 3)
+        self.assertFalse(pynetlify.Manifest())
+
+    def test_items_yields_paths_and_hex_digests(self):
+        self.assertEqual(list(self._manifest.items()),
+                         [(path, binascii.hexlify(digest).decode('ascii'))
+                          for path, digest in self._files])
+
+    def test_path_of(self):
+        for path, digest in self._files:
+            self.assertEqual(self._manifest.path_of(binascii.hexlify(digest).decode('ascii')), path)
+
+    def test_path_of_after_add(self):
+        self._manifest.path_of(binascii.hexlify(self._files[0][1]).decode('ascii'))
+        digest = hashlib.sha1(b'new').digest()
+        self._manifest.add('new.html', digest)
+        self.assertEqual(self._manifest.path_of(binascii.hexlify(digest).decode('ascii')), 'new.html')
+
+    def test_path_of_raises_key_error_for_unknown_digest(self):
+        with self.assertRaises(KeyError):
+            self._manifest.path_of(hashlib.sha1(b'unknown').hexdigest())
+
+    def test_path_of_raises_key_error_for_malformed_digest(self):
+        for hexdigest in ('zz', 'abc', 'ab', None):
+            with self.assertRaises(KeyError):
+                self._manifest.path_of(hexdigest)
+
+    def test_add_raises_value_error_for_hex_digest(self):
+        with self.assertRaises(ValueError):
+            self._manifest.add('file.html', hashlib.sha1(b'file').hexdigest())
+
+    def test_iter_manifest_json_encodes_manifest(self):
+        payload = b''.join(pynetlify.iter_manifest_json(self._manifest))
+        self.assertEqual(json.loads(payload.decode('utf-8')),
+                         {'files': dict(self._manifest.items())})
+
 
 if __name__ == '__main__':
     unittest.main()